@@ -1,20 +1,85 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, session, stream_with_context
+import json
+import logging
 import os
+import re
+import threading
+import time
+import uuid
 from flask_cors import CORS
-import google.generativeai as genai
+
+import metrics
+from context import ContextWindow
+from limits import ConcurrencyLimiter, ConversationBusy, Overloaded
+from llm import ProviderTimeout, create_router
+from response_cache import ResponseCache
+from safety import CRISIS_REPLY, screen, tag_flagged, tagged
+from sessions import (
+    Conversation,
+    InvalidSession,
+    UnknownSession,
+    create_session_store,
+    is_session_id,
+    new_session_id,
+)
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(message)s")
+logger = logging.getLogger("chatbot")
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "supersecretkey")
 
-api_key = os.environ.get("GEMINI_API_KEY")
-if not api_key:
-    raise EnvironmentError("GEMINI_API_KEY environment variable is not set.")
+if not os.environ.get("GEMINI_API_KEY") and not os.environ.get("GROQ_API_KEY"):
+    raise EnvironmentError("Neither GEMINI_API_KEY nor GROQ_API_KEY environment variable is set.")
+
+# Gemini first, Groq as failover (see LLM_PROVIDERS / LLM_HEDGE)
+router = create_router("gemini,groq")
+
+# Provider SDKs are imported on first use so routes that never call a model
+# start fast. LLM_PREWARM=1 loads them (and opens connections) in the
+# background instead; the router lives for as long as the warm instance.
+if os.environ.get("LLM_PREWARM", "0") == "1":
+    threading.Thread(target=router.warm, daemon=True, name="llm-prewarm").start()
+
+session_store = create_session_store()
+
+# Bounded number of model calls in flight per process, and one hard deadline
+# per request (shared by summarizing, failover, hedging and streaming), so
+# overload turns into fast 429/503/504s instead of a pile-up.
+limiter = ConcurrencyLimiter(
+    max_in_flight=int(os.environ.get("MAX_IN_FLIGHT", 100)),
+    max_wait=float(os.environ.get("MAX_QUEUE_WAIT_SECONDS", 0)),
+)
+llm_timeout = float(os.environ.get("LLM_TIMEOUT_SECONDS", 30))
 
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("gemini-1.5-flash")
+# Optional cache of replies to opening messages ("I feel anxious", ...)
+response_cache = None
+if os.environ.get("RESPONSE_CACHE", "0") == "1":
+    response_cache = ResponseCache(
+        maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)),
+        ttl=int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 3600)),
+        threshold=float(os.environ.get("RESPONSE_CACHE_THRESHOLD", 0.8)),
+        on_lookup=lambda result: metrics.cache_lookups.inc(result=result),
+    )
+cache_max_history = int(os.environ.get("RESPONSE_CACHE_MAX_HISTORY", 0))
 
-# Mental Health Chatbot Prompt
+# Messages the local crisis screen marks as a crisis (an explicit phrase) get
+# CRISIS_REPLY straight away instead of waiting on the model; set to 0 to only
+# tag them for the model. Ambiguous phrases and high scores are always just
+# tagged (see safety.py).
+crisis_short_circuit = os.environ.get("CRISIS_SHORT_CIRCUIT", "1") == "1"
+
+# Opt-in sampling profiler: requests slower than PROFILE_SLOW_MS get their
+# folded stack samples written to PROFILE_DIR/<request id>.folded.
+profile_slow_ms = float(os.environ.get("PROFILE_SLOW_MS", 0))
+profile_dir = os.environ.get("PROFILE_DIR", "profiles")
+
+# Client-supplied request ids are echoed and used in file names, so only
+# short plain tokens are accepted; anything else gets a fresh id.
+request_id_pattern = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Mental Health Chatbot Prompt (sent as the system instruction, not with every message)
 mental_health_prompt = '''
 You are a highly empathetic and supportive mental health chatbot trained in evidence-based techniques such as Cognitive Behavioral Therapy (CBT), mindfulness, grounding exercises, and positive psychology. Your role is to provide users with emotional support, help them manage stress, anxiety, and depressive thoughts, and guide them through structured techniques to improve their mental well-being.
 
@@ -51,41 +116,436 @@ If a user expresses feelings of self-harm, suicidal ideation, or severe emotiona
 Act Like Elon Musk
 '''
 
+
+def summarize(summary, messages):
+    transcript = "\n".join(f"{msg['role']}: {msg['parts']}" for msg in messages)
+    prompt = (
+        "Update the running summary of a supportive mental health conversation. "
+        "Keep the user's situation, feelings, and any techniques already tried. "
+        "Reply with the summary only.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+    try:
+        reply = router.generate(None, [], prompt, deadline=g.deadline)
+    except Exception as e:
+        # Keep the old summary and just drop the turns: losing their detail
+        # beats failing the user's message over a bookkeeping call.
+        metrics.errors.inc(type=type(e).__name__)
+        g.log["summary_error"] = f"{type(e).__name__}: {e}"
+        logger.warning(f"Summarizing for request {g.request_id} failed: {type(e).__name__}: {e}")
+        return summary
+
+    # Counted into this request's usage by record_usage
+    g.summary_usage = reply.usage
+    metrics.tokens.observe(reply.usage["prompt_tokens"], kind="summary_prompt", provider=reply.provider)
+    metrics.tokens.observe(reply.usage["completion_tokens"], kind="summary_completion", provider=reply.provider)
+    return reply.text
+
+
+context_window = ContextWindow(
+    max_tokens=int(os.environ.get("CONTEXT_MAX_TOKENS", 6000)),
+    low_watermark=float(os.environ.get("CONTEXT_LOW_WATERMARK", 0.5)),
+    summarize=summarize,
+)
+
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def load_conversation(data):
+    # Clients that still send the full "history" get a throwaway conversation
+    # built from it; everyone else is served from the session store. Session
+    # ids are only issued by the server: a client-supplied id must already be
+    # known, and a new conversation always gets a fresh one.
+    session_id = data.get("session_id")
+    if "history" in data:
+        if not data.get("resume"):
+            return Conversation(None, data.get("history") or [])
+        # A client told its session is unknown (409, see session_response:
+        # it expired, or this instance or worker never had it) resends its
+        # own copy of the history with "resume" to start a new session
+        conversation = Conversation(new_session_id(), data.get("history") or [])
+    elif session_id is not None:
+        if not is_session_id(session_id):
+            raise InvalidSession("Invalid session_id")
+        conversation = session_store.get(session_id)
+        if conversation is None:
+            raise UnknownSession("Unknown or expired session")
+    else:
+        # The signed cookie only ever holds an id this server issued; if that
+        # session has expired, start over rather than fail the request.
+        conversation = session_store.get(session.get("session_id", ""))
+        if conversation is None:
+            conversation = Conversation(new_session_id())
+
+    session["session_id"] = conversation.id
+    return conversation
+
+
+def model_history(conversation):
+    # Stateless clients resend everything, so their old turns are only trimmed
+    # (summarizing them would cost an extra model call on every request), and
+    # only in the copy sent to the model: they get their full history back.
+    if conversation.id is None:
+        history = tag_flagged(context_window.trim(conversation.history))
+    else:
+        context_window.fit(conversation)
+        history = tag_flagged(conversation.history)
+    if not conversation.summary:
+        return history
+    return [
+        {"role": "user", "parts": f"Summary of our conversation so far:\n{conversation.summary}"},
+        {"role": "assistant", "parts": "Thanks, I'll keep that in mind."},
+    ] + history
+
+
+def cacheable(conversation, flagged):
+    # Only early turns are generic enough to share, and flagged messages must
+    # always get a fresh reply.
+    return (
+        response_cache is not None
+        and len(conversation.history) <= cache_max_history
+        and not conversation.summary
+        and not flagged
+    )
+
+
+def cached_reply(conversation, user_message, flagged):
+    if not cacheable(conversation, flagged):
+        return None
+    return response_cache.lookup(user_message)
+
+
+def remember_reply(conversation, user_message, reply, flagged):
+    if cacheable(conversation, flagged):
+        response_cache.store(user_message, reply)
+
+
+def claim(conversation):
+    # One turn at a time per conversation, and one limiter slot per turn
+    if not conversation.lock.acquire(blocking=False):
+        raise ConversationBusy("A reply to this conversation is already in progress")
+    try:
+        limiter.acquire()
+    except Overloaded:
+        conversation.lock.release()
+        raise
+
+
+def release(conversation):
+    limiter.release()
+    conversation.lock.release()
+
+
+def session_response(e):
+    if isinstance(e, InvalidSession):
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"error": str(e), "unknown_session": True}), 409
+
+
+def overload_response(e):
+    if isinstance(e, ConversationBusy):
+        return jsonify({"error": str(e)}), 429
+    if isinstance(e, Overloaded):
+        return jsonify({"error": "Server is busy, please retry shortly."}), 503, {"Retry-After": "1"}
+    return jsonify({"error": "The model took too long to respond."}), 504
+
+
+def record_error(e):
+    metrics.errors.inc(type=type(e).__name__)
+    g.log["error"] = f"{type(e).__name__}: {e}"
+
+
+def record_usage(reply):
+    # Returns the request's total usage: the reply plus any summary call
+    usage = dict(reply.usage)
+    summary_usage = g.get("summary_usage")
+    if summary_usage:
+        usage = {key: value + summary_usage[key] for key, value in usage.items()}
+        g.log["summary_tokens"] = summary_usage["total_tokens"]
+    g.log.update(provider=reply.provider, **usage)
+    metrics.tokens.observe(reply.usage["prompt_tokens"], kind="prompt", provider=reply.provider)
+    metrics.tokens.observe(reply.usage["completion_tokens"], kind="completion", provider=reply.provider)
+    return usage
+
+
+@app.before_request
+def start_request():
+    request_id = request.headers.get("X-Request-ID", "")
+    g.request_id = request_id if request_id_pattern.fullmatch(request_id) else uuid.uuid4().hex
+    g.timer = metrics.RequestTimer()
+    g.deadline = time.monotonic() + llm_timeout
+    g.log = {}
+    g.sampler = metrics.StackSampler(threading.get_ident()).start() if profile_slow_ms else None
+    metrics.requests_in_flight.inc()
+
+
+@app.after_request
+def tag_response(response):
+    response.headers["X-Request-ID"] = g.request_id
+    g.status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request(exc):
+    # Runs once the response has been fully sent, including streams
+    elapsed = g.timer.elapsed()
+    status = g.get("status", 500)
+    metrics.requests_in_flight.dec()
+    metrics.request_duration.observe(elapsed, endpoint=request.endpoint or "unknown", status=status)
+
+    if g.sampler is not None:
+        g.sampler.stop()
+        if elapsed * 1000 >= profile_slow_ms:
+            os.makedirs(profile_dir, exist_ok=True)
+            g.log["profile"] = os.path.join(profile_dir, f"{g.request_id}.folded")
+            g.sampler.write(g.log["profile"])
+
+    if request.endpoint != "prometheus_metrics":
+        logger.info(json.dumps({
+            "time": time.time(),
+            "request_id": g.request_id,
+            "method": request.method,
+            "path": request.path,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in g.timer.stages.items()},
+            **g.log,
+        }))
+
+
+def finish_turn(conversation, user_message, reply, flagged=False):
+    # Append user and assistant messages to history
+    if flagged:
+        conversation.history.append({"role": "user", "parts": user_message, "crisis": True})
+    else:
+        conversation.history.append({"role": "user", "parts": user_message})
+    conversation.history.append({"role": "assistant", "parts": reply})
+
+    if conversation.id is None:
+        return {"history": conversation.history}  # Return updated history
+
+    session_store.save(conversation)
+    return {"session_id": conversation.id}
+
+
+def crisis_turn(conversation, user_message):
+    # Answered locally, so it never waits for a limiter slot. If another turn
+    # of this conversation is still running, reply without recording it.
+    if not conversation.lock.acquire(blocking=False):
+        return {"session_id": conversation.id} if conversation.id else {}
+    try:
+        return finish_turn(conversation, user_message, CRISIS_REPLY, flagged=True)
+    finally:
+        conversation.lock.release()
+
+
+def cached_turn(conversation, user_message, reply):
+    # Also answered locally without a limiter slot, so cache hits are still
+    # served under overload, but one turn at a time per conversation.
+    if not conversation.lock.acquire(blocking=False):
+        raise ConversationBusy("A reply to this conversation is already in progress")
+    try:
+        return finish_turn(conversation, user_message, reply)
+    finally:
+        conversation.lock.release()
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
+    timer = g.timer
     try:
-        data = request.json
+        with timer.span("parse"):
+            data = request.json
         user_message = data.get("message")
-        chat_history = data.get("history", [])
 
         if not user_message:
             return jsonify({"error": "Message is required"}), 400
 
-        # Prepare chat history for the Gemini model
-        formatted_history = [
-            {"role": "user", "parts": msg["parts"]} if msg["role"] == "user" else
-            {"role": "model", "parts": msg["parts"]}
-            for msg in chat_history
-        ]
+        if data.get("stream"):
+            return chat_stream()
+
+        with timer.span("session"):
+            conversation = load_conversation(data)
+        metrics.history_length.observe(len(conversation.history))
+        g.log.update(session_id=conversation.id, history_messages=len(conversation.history))
 
-        chat = model.start_chat(history=formatted_history)
-        response = chat.send_message(f"{mental_health_prompt}\nUser: {user_message}")
+        with timer.span("screen"):
+            screening = screen(user_message)
+        flagged = screening.flagged
+        if screening.crisis and crisis_short_circuit:
+            g.log["crisis"] = True
+            result = crisis_turn(conversation, user_message)
+            return jsonify({"content": CRISIS_REPLY, "crisis": True, **result})
 
-        # Append user and assistant messages to history
-        chat_history.append({"role": "user", "parts": user_message})
-        chat_history.append({"role": "assistant", "parts": response.text})
+        with timer.span("cache"):
+            reply = cached_reply(conversation, user_message, flagged)
+        if reply is not None:
+            g.log["cached"] = True
+            result = cached_turn(conversation, user_message, reply)
+            return jsonify({"content": reply, "cached": True, **result})
 
-        return jsonify({
-            "content": response.text,
-            "history": chat_history  # Return updated history
-        })
+        claim(conversation)
+        try:
+            with timer.span("context"):
+                history = model_history(conversation)
+            with timer.span("model"):
+                reply = router.generate(
+                    mental_health_prompt,
+                    history,
+                    tagged(user_message) if flagged else user_message,
+                    deadline=g.deadline,
+                )
+            usage = record_usage(reply)
+            with timer.span("store"):
+                remember_reply(conversation, user_message, reply.text, flagged)
+                result = finish_turn(conversation, user_message, reply.text, flagged)
+        finally:
+            release(conversation)
+
+        with timer.span("serialize"):
+            return jsonify({"content": reply.text, "usage": usage, "provider": reply.provider, **result})
+
+    except (InvalidSession, UnknownSession) as e:
+        record_error(e)
+        return session_response(e)
+
+    except (ConversationBusy, Overloaded, ProviderTimeout) as e:
+        record_error(e)
+        return overload_response(e)
 
     except Exception as e:
-        print(f"Error: {str(e)}")
+        record_error(e)
+        logger.exception(f"Error handling request {g.request_id}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    # Server-Sent Events variant of /chat: one "content" frame per generated
+    # chunk, then a final "done" frame carrying the session id (or the
+    # updated history for clients that sent one).
+    timer = g.timer
+    with timer.span("parse"):
+        data = request.json
+    user_message = data.get("message")
+
+    if not user_message:
+        return jsonify({"error": "Message is required"}), 400
+
+    try:
+        with timer.span("session"):
+            conversation = load_conversation(data)
+    except (InvalidSession, UnknownSession) as e:
+        record_error(e)
+        return session_response(e)
+    metrics.history_length.observe(len(conversation.history))
+    g.log.update(session_id=conversation.id, history_messages=len(conversation.history), stream=True)
+
+    with timer.span("screen"):
+        screening = screen(user_message)
+    flagged = screening.flagged
+    if screening.crisis and crisis_short_circuit:
+        g.log["crisis"] = True
+        result = crisis_turn(conversation, user_message)
+        return Response(
+            sse_event({"content": CRISIS_REPLY})
+            + sse_event({"done": True, "content": CRISIS_REPLY, "crisis": True, **result}),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    try:
+        with timer.span("cache"):
+            reply = cached_reply(conversation, user_message, flagged)
+        if reply is not None:
+            g.log["cached"] = True
+            result = cached_turn(conversation, user_message, reply)
+            return Response(
+                sse_event({"content": reply}) + sse_event({"done": True, "content": reply, "cached": True, **result}),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache"},
+            )
+
+        claim(conversation)
+    except (ConversationBusy, Overloaded) as e:
+        record_error(e)
+        return overload_response(e)
+
+    # The turn is released before the final frame goes out, so a client that
+    # sends its next message straight away isn't told the chat is still busy.
+    # call_on_close covers clients that disconnect before the stream starts.
+    turn_open = threading.Lock()
+
+    def end_turn():
+        if turn_open.acquire(blocking=False):
+            release(conversation)
+
+    def generate():
+        try:
+            with timer.span("context"):
+                history = model_history(conversation)
+            with timer.span("model"):
+                stream = router.stream(
+                    mental_health_prompt,
+                    history,
+                    tagged(user_message) if flagged else user_message,
+                    deadline=g.deadline,
+                )
+            first = True
+            for chunk in stream:
+                if first:
+                    first = False
+                    metrics.time_to_first_token.observe(timer.elapsed())
+                    g.log["ttft_ms"] = round(timer.elapsed() * 1000, 2)
+                yield sse_event({"content": chunk})
+            usage = record_usage(stream)
+
+            with timer.span("store"):
+                remember_reply(conversation, user_message, stream.text, flagged)
+                result = finish_turn(conversation, user_message, stream.text, flagged)
+            end_turn()
+
+            yield sse_event({
+                "done": True,
+                "content": stream.text,
+                "usage": usage,
+                "provider": stream.provider,
+                **result,
+            })
+
+        except Exception as e:
+            record_error(e)
+            logger.exception(f"Error streaming request {g.request_id}")
+            end_turn()
+            yield sse_event({"done": True, "error": str(e)})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(end_turn)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    metrics.model_calls_in_flight.set(limiter.in_flight)
+    return Response(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **response_cache.stats()})
+
 @app.route('/clear-chat', methods=['POST'])
 def clear_chat():
+    data = request.get_json(silent=True) or {}
+    session_id = data.get("session_id") or session.pop("session_id", None)
+    if is_session_id(session_id):
+        session_store.delete(session_id)
     return jsonify({"status": "Chat history cleared.", "history": []})
 
 
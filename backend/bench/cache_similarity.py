@@ -0,0 +1,79 @@
+# Checks which message pairs the response cache treats as the same, to pick
+# RESPONSE_CACHE_THRESHOLD (ResponseCache's default threshold).
+#
+#   python bench/cache_similarity.py [--thresholds 0.8,0.85,0.9,0.95]
+#
+# Each pair is a cached message and a later one, with whether the later one
+# may get the cached reply. A wrong match sends one user's reply to another
+# user about a different person or the opposite feeling, so the default must
+# have none; within that, more correct matches means more hits.
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache, content_words, ngram_vector, normalize  # noqa: E402
+
+PAIRS = (
+    # Should match: same meaning, different filler, case or punctuation
+    ("I feel anxious", "i feel anxious!", True),
+    ("I feel anxious", "I'm feeling anxious", True),
+    ("I feel anxious", "I feel really anxious", True),
+    ("I feel so lonely", "I feel lonely", True),
+    ("I'm stressed about work", "I am stressed about work", True),
+    ("I can't sleep", "I cant sleep", True),
+    ("I feel anxious about my exams", "feeling anxious about exams", True),
+    ("hi, I feel sad today", "hi I feel sad", True),
+    ("How can I calm down?", "how can i calm down", True),
+    ("I'm feeling overwhelmed", "I feel overwhelmed lately", True),
+    # Must not match: one word changes who or what the message is about
+    ("I feel anxious about my mom", "I feel anxious about my dad", False),
+    ("I feel better today", "I feel bitter today", False),
+    ("my dog died", "my cat died", False),
+    ("I feel anxious", "I don't feel anxious", False),
+    ("I feel anxious", "I never feel anxious", False),
+    ("I can sleep", "I can't sleep", False),
+    ("I feel happy", "I feel unhappy", False),
+    ("I'm stressed about work", "I'm stressed about school", False),
+    ("I'm angry at my brother", "I'm angry at my mother", False),
+    ("my husband left me", "my husband hit me", False),
+    ("I feel lonely at night", "I feel lonely at work", False),
+    ("I feel anxious", "I feel anxious and sad", False),
+    ("my mom yelled at my dad", "my dad yelled at my mom", False),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check response cache matches for a set of message pairs")
+    parser.add_argument("--thresholds", default="0.8,0.85,0.9,0.95")
+    args = parser.parse_args()
+
+    for cached, message, same in PAIRS:
+        a, b = normalize(cached), normalize(message)
+        va, vb = ngram_vector(a), ngram_vector(b)
+        cosine = sum(weight * vb.get(gram, 0.0) for gram, weight in va.items())
+        words = "same" if content_words(a) == content_words(b) else "differ"
+        print(f"{cosine:.2f} words {words:6} {'match' if same else 'no match':8}  {cached!r} / {message!r}")
+
+    report = {}
+    for threshold in map(float, args.thresholds.split(",")):
+        correct = wrong = 0
+        for cached, message, same in PAIRS:
+            cache = ResponseCache(threshold=threshold)
+            cache.store(cached, "reply")
+            hit = cache.lookup(message) is not None
+            correct += hit and same
+            wrong += hit and not same
+        report[threshold] = {
+            "correct_matches": correct,
+            "wrong_matches": wrong,
+            "possible_matches": sum(same for _, _, same in PAIRS),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Cold start benchmark: how long a fresh process takes to import app.py, to
+# answer a route that never touches the model (/clear-chat), and to answer
+# its first /chat, for each Gemini transport.
+#
+#   python bench/cold_start.py [--runs 5] [--transports grpc,httpx] [--ref REV]
+#
+# --ref also measures the backend as of a git revision (exported with
+# git archive), so before/after numbers come from the same run and machine;
+# e.g. --ref c33cf9a^ for the eager-import version. Revisions without the
+# httpx transport ignore GEMINI_TRANSPORT and use gRPC.
+#
+# Model calls go to bench/fake_llm.py, so no API quota is used.
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from loadtest import BACKEND_DIR, BENCH_DIR, free_port, stop, wait_for
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+modules = len(sys.modules)
+client = app.app.test_client()
+client.post("/clear-chat")
+cleared = time.perf_counter()
+status = client.post("/chat", json={"message": "hello"}).status_code
+chatted = time.perf_counter()
+print(json.dumps({
+    "import_app_ms": (imported - start) * 1000,
+    "first_clear_chat_ms": (cleared - start) * 1000,
+    "first_chat_ms": (chatted - start) * 1000,
+    "modules_after_import": modules,
+    "chat_status": status,
+}))
+"""
+
+
+def export(ref, directory):
+    # The backend directory as of ref, unpacked under directory
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", ref, "--", "."], cwd=BACKEND_DIR, capture_output=True, check=True
+    ).stdout
+    path = os.path.join(directory, "backend")
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(path)
+    return path
+
+
+def measure(backend_dir, transport, fake_url, runs):
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY="fake",
+        GEMINI_API_ENDPOINT=fake_url,
+        GEMINI_TRANSPORT=transport,
+        LLM_PROVIDERS="gemini",
+        LOG_LEVEL="WARNING",
+    )
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=backend_dir, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample["process_ms"] = (time.perf_counter() - start) * 1000
+        samples.append(sample)
+
+    return {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in ("process_ms", "import_app_ms", "first_clear_chat_ms", "first_chat_ms", "modules_after_import")
+    } | {"chat_status": samples[-1]["chat_status"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--transports", default="grpc,httpx")
+    parser.add_argument("--ref", help="also measure the backend at this git revision")
+    args = parser.parse_args()
+    transports = args.transports.split(",")
+
+    port = free_port()
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"),
+        "--port", str(port), "--latency", "0", "--tokens-per-second", "0", "--reply-tokens", "20",
+    ], stdout=subprocess.DEVNULL)
+    try:
+        fake_url = f"http://127.0.0.1:{port}"
+        wait_for(f"{fake_url}/")
+        report = {transport: measure(BACKEND_DIR, transport, fake_url, args.runs) for transport in transports}
+        if args.ref:
+            with tempfile.TemporaryDirectory() as directory:
+                backend_dir = export(args.ref, directory)
+                report = {
+                    "working_tree": report,
+                    args.ref: {transport: measure(backend_dir, transport, fake_url, args.runs) for transport in transports},
+                }
+    finally:
+        stop(fake)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
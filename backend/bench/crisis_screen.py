@@ -0,0 +1,70 @@
+# Per-message overhead and recall of the local crisis pre-screen.
+#
+#   python bench/crisis_screen.py [--rounds 200]
+#
+# Runs safety.screen over the held-out messages in crisis_heldout.jsonl, which
+# are never used to fit the scoring model (see fit_crisis_model.py).
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import safety  # noqa: E402
+
+HELDOUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_heldout.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(HELDOUT, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    texts = [row["text"] for row in rows]
+
+    # A crisis gets the canned reply; flagged messages still reach the model
+    # (tagged), so recall counts both while precision is about the reply.
+    true_pos = false_pos = false_neg = flagged_pos = flagged_safe = 0
+    for row in rows:
+        result = safety.screen(row["text"])
+        if result.crisis and row["crisis"]:
+            true_pos += 1
+        elif result.crisis:
+            false_pos += 1
+            print(f"false positive ({result.score:.2f}): {row['text']}")
+        elif result.flagged:
+            if row["crisis"]:
+                flagged_pos += 1
+            else:
+                flagged_safe += 1
+            print(f"flagged for the model ({result.score:.2f}): {row['text']}")
+        elif row["crisis"]:
+            false_neg += 1
+            print(f"missed ({result.score:.2f}): {row['text']}")
+
+    timings = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        for text in texts:
+            safety.screen(text)
+        timings.append((time.perf_counter() - start) / len(texts))
+    timings.sort()
+
+    print(json.dumps({
+        "messages": len(rows),
+        "crisis_recall": true_pos / (true_pos + flagged_pos + false_neg),
+        "flagged_recall": (true_pos + flagged_pos) / (true_pos + flagged_pos + false_neg),
+        "crisis_precision": true_pos / (true_pos + false_pos) if true_pos + false_pos else 1.0,
+        "safe_flagged": flagged_safe,
+        "us_per_message_p50": timings[len(timings) // 2] * 1e6,
+        "us_per_message_p99": timings[int(len(timings) * 0.99)] * 1e6,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
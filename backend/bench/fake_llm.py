@@ -0,0 +1,173 @@
+# Local stand-in for the Gemini (REST) and Groq (OpenAI-compatible) APIs, so
+# the backend can be load tested without spending API quota.
+#
+#   python bench/fake_llm.py --port 8090 --latency 0.3 --tokens-per-second 80
+#
+# Point the backend at it with
+#   GEMINI_API_ENDPOINT=http://127.0.0.1:8090 GROQ_BASE_URL=http://127.0.0.1:8090
+
+import argparse
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "I hear you and it makes sense to feel that way. Let's take a slow breath "
+    "together and notice five things you can see around you right now. What "
+    "feels most heavy for you at the moment?"
+).split()
+
+_gemini_path = re.compile(r"^/v1beta/models/(?P<model>[^:]+):(?P<method>generateContent|streamGenerateContent)")
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        config = self.config
+
+        if config.error_rate and random.random() < config.error_rate:
+            time.sleep(config.latency)
+            return self._send_json(config.error_status, {"error": {"code": config.error_status, "message": "injected error"}})
+
+        prompt_tokens = len(body) // 4 + 1
+        words = [random.choice(WORDS) for _ in range(config.reply_tokens)]
+
+        match = _gemini_path.match(self.path)
+        if match is not None:
+            stream = match.group("method") == "streamGenerateContent"
+            return self._gemini(words, prompt_tokens, stream)
+        if self.path.startswith("/openai/v1/chat/completions"):
+            request = json.loads(body or b"{}")
+            return self._groq(words, prompt_tokens, request.get("stream", False), request.get("model", "fake"))
+
+        self._send_json(404, {"error": {"code": 404, "message": f"unknown path {self.path}"}})
+
+    def _pace(self, words):
+        # Time to first token, then a steady token rate
+        time.sleep(self.config.latency)
+        delay = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+        for i, word in enumerate(words):
+            if i and delay:
+                time.sleep(delay)
+            yield word + " "
+
+    def _gemini_payload(self, text, prompt_tokens, completion_tokens, finished):
+        payload = {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": completion_tokens,
+                "totalTokenCount": prompt_tokens + completion_tokens,
+            },
+        }
+        if finished:
+            payload["candidates"][0]["finishReason"] = "STOP"
+        return payload
+
+    def _gemini(self, words, prompt_tokens, stream):
+        if not stream:
+            text = "".join(self._pace(words))
+            return self._send_json(200, self._gemini_payload(text, prompt_tokens, len(words), True))
+
+        # The REST client reads a streamed JSON array unless it asked for SSE
+        sse = "alt=sse" in self.path
+        self._start_events("text/event-stream" if sse else "application/json")
+        for i, word in enumerate(self._pace(words)):
+            payload = self._gemini_payload(word, prompt_tokens, i + 1, i == len(words) - 1)
+            if sse:
+                self._send_event(payload)
+            else:
+                self._send_chunk(("[" if i == 0 else ",\r\n").encode() + json.dumps(payload).encode())
+        if not sse:
+            self._send_chunk(b"]")
+        self._end_events()
+
+    def _groq(self, words, prompt_tokens, stream, model):
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": model}
+
+        if not stream:
+            text = "".join(self._pace(words))
+            return self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self._start_events()
+        for word in self._pace(words):
+            self._send_event({
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+            })
+        self._send_event({
+            **base,
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": "fake", "usage": usage},
+        })
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._end_events()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_events(self, content_type="text/event-stream"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_event(self, payload):
+        self._send_chunk(f"data: {json.dumps(payload)}\r\n\r\n".encode())
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_events(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Fake Gemini/Groq API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="0 sends all tokens at once")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    return parser
+
+
+def serve(config):
+    FakeLLMHandler.config = config
+    server = ThreadingHTTPServer((config.host, config.port), FakeLLMHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    server = serve(build_parser().parse_args())
+    print(f"Fake LLM API listening on http://{server.server_address[0]}:{server.server_address[1]}", flush=True)
+    server.serve_forever()
@@ -0,0 +1,146 @@
+# Fits the crisis screen's scoring model (safety.FEATURE_WEIGHTS / BIAS).
+#
+#   python bench/fit_crisis_model.py [--min-count 3] [--l2 0.002]
+#
+# Trains an L2-regularised logistic regression on crisis_train.jsonl, using
+# only features seen in at least --min-count training messages so no weight
+# is tied to one sentence. Hyperparameters and thresholds are chosen from
+# cross-validation on the training set; crisis_heldout.jsonl is only used to
+# report the final model. Paste the printed weights into safety.py.
+
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import safety  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN = os.path.join(BENCH_DIR, "crisis_train.jsonl")
+HELDOUT = os.path.join(BENCH_DIR, "crisis_heldout.jsonl")
+
+
+# Function words carry no signal of their own at this data size; features made
+# only of them are left out. Negations ("no", "never", "won't") are kept.
+STOP_WORDS = {
+    "a", "about", "am", "an", "and", "are", "as", "at", "be", "been", "but", "by", "do", "for", "from", "had",
+    "has", "have", "he", "her", "him", "his", "i", "i'd", "i'm", "i've", "if", "in", "is", "it", "it's", "just",
+    "like", "me", "my", "of", "on", "or", "our", "she", "so", "that", "the", "their", "them", "they", "this",
+    "to", "was", "we", "were", "when", "what", "with", "would", "you", "your",
+    # Filler that only picked up weight from which crisis messages happened to
+    # be in the training set
+    "all", "around", "can", "everything", "get", "go", "going", "here", "how", "keep", "know", "last", "need",
+    "not", "now", "see", "than", "there", "there's", "think", "up", "want", "way",
+}
+
+
+def informative(feature):
+    return any(word not in STOP_WORDS for word in feature.split())
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def fit(rows, min_count, l2, rate, epochs):
+    counts = {}
+    for row in rows:
+        for feature in filter(informative, safety.features(row["text"])):
+            counts[feature] = counts.get(feature, 0) + 1
+    vocabulary = sorted(feature for feature, count in counts.items() if count >= min_count)
+
+    examples = [
+        ([feature for feature in safety.features(row["text"]) if counts.get(feature, 0) >= min_count],
+         1.0 if row["crisis"] else 0.0)
+        for row in rows
+    ]
+    weights = dict.fromkeys(vocabulary, 0.0)
+    bias = 0.0
+
+    # Full-batch gradient descent; deterministic, and fast enough at this size
+    for _ in range(epochs):
+        gradient = dict.fromkeys(weights, 0.0)
+        bias_gradient = 0.0
+        for active, label in examples:
+            error = sigmoid(bias + sum(weights[feature] for feature in active)) - label
+            bias_gradient += error
+            for feature in active:
+                gradient[feature] += error
+        bias -= rate * bias_gradient / len(examples)
+        for feature in weights:
+            weights[feature] -= rate * (gradient[feature] / len(examples) + l2 * weights[feature])
+
+    return {feature: round(weight, 2) for feature, weight in weights.items() if abs(weight) >= 0.05}, round(bias, 2)
+
+
+def predictor(weights, bias, threshold):
+    def predict(text):
+        total = bias + sum(weights.get(feature, 0.0) for feature in safety.features(text))
+        return sigmoid(total) >= threshold
+
+    return predict
+
+
+def cross_validate(rows, folds, threshold, **params):
+    results = []
+    for fold in range(folds):
+        predict = predictor(*fit([row for i, row in enumerate(rows) if i % folds != fold], **params), threshold)
+        results.extend(
+            (row["crisis"], predict(row["text"])) for i, row in enumerate(rows) if i % folds == fold
+        )
+    return evaluate(results)
+
+
+def evaluate(results):
+    # results: (labelled crisis, flagged) pairs
+    results = list(results)
+    true_pos = false_pos = false_neg = 0
+    for crisis, flagged in results:
+        true_pos += crisis and flagged
+        false_pos += flagged and not crisis
+        false_neg += crisis and not flagged
+    return {
+        "messages": len(results),
+        "recall": true_pos / (true_pos + false_neg) if true_pos + false_neg else 1.0,
+        "precision": true_pos / (true_pos + false_pos) if true_pos + false_pos else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the crisis screen's scoring model")
+    parser.add_argument("--min-count", type=int, default=3, help="training messages a feature must appear in")
+    parser.add_argument("--l2", type=float, default=0.002)
+    parser.add_argument("--rate", type=float, default=1.0)
+    parser.add_argument("--epochs", type=int, default=1500)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=safety.FLAG_THRESHOLD)
+    args = parser.parse_args()
+
+    params = {"min_count": args.min_count, "l2": args.l2, "rate": args.rate, "epochs": args.epochs}
+    train = load(TRAIN)
+    weights, bias = fit(train, **params)
+    predict = predictor(weights, bias, args.threshold)
+
+    print("FEATURE_WEIGHTS = {")
+    for feature, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+        print(f"    {json.dumps(feature)}: {weight},")
+    print("}")
+    print(f"BIAS = {bias}")
+    print(json.dumps({
+        "features": len(weights),
+        "train": evaluate((row["crisis"], predict(row["text"])) for row in train),
+        "cross_validation": cross_validate(train, args.folds, args.threshold, **params),
+        "heldout": evaluate((row["crisis"], predict(row["text"])) for row in load(HELDOUT)),
+    }, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+# Load and latency benchmark for the backend, run against bench/fake_llm.py
+# instead of the real Gemini/Groq APIs.
+#
+#   python bench/loadtest.py --users 20 --turns 8 --output bench/baseline.json
+#   python bench/loadtest.py --stream --compare bench/baseline.json
+#
+# Starts the fake LLM API and app.py as subprocesses, drives concurrent
+# synthetic conversations of growing length, and reports throughput, latency,
+# time to first token, payload sizes and server CPU/memory per request.
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+MESSAGES = (
+    "I feel anxious about work lately",
+    "I can't sleep well at night",
+    "My exams are coming up and I'm stressed",
+    "I had an argument with my partner",
+    "Can you suggest a grounding exercise?",
+    "That helped a little, thank you",
+    "I keep overthinking small things",
+    "How do I stop procrastinating?",
+    "I feel lonely since moving cities",
+    "What should I try when I feel overwhelmed?",
+)
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED = {
+    "rps": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "ttft_ms.p95": False,
+    "request_bytes.mean": False,
+    "response_bytes.mean": False,
+    "server.cpu_ms_per_request": False,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def process_tree(pid):
+    # pid plus its direct children (gunicorn workers), Linux only
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return pids
+
+
+def cpu_seconds(pid):
+    total = 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])  # utime + stime
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def rss_bytes(pid):
+    total = 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+    return total
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(q):
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    return {
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "mean": sum(values) / len(values),
+        "max": values[-1],
+    }
+
+
+def run_conversation(base_url, user, args, results):
+    history = []
+    session_id = None  # issued by the server on the first turn
+
+    with httpx.Client(base_url=base_url, timeout=args.request_timeout) as client:
+        for turn in range(args.turns):
+            message = f"{MESSAGES[(user + turn) % len(MESSAGES)]} ({turn + 1})"
+            body = {"message": message}
+            if args.mode == "history":
+                body["history"] = history
+            elif session_id:
+                body["session_id"] = session_id
+            payload = json.dumps(body).encode()
+
+            start = time.perf_counter()
+            ttft = None
+            status = None
+            response_bytes = 0
+            reply = None
+            try:
+                if args.stream:
+                    with client.stream("POST", "/chat/stream", content=payload,
+                                       headers={"Content-Type": "application/json"}) as response:
+                        status = response.status_code
+                        for line in response.iter_lines():
+                            response_bytes += len(line) + 1
+                            if not line.startswith("data: "):
+                                continue
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                            frame = json.loads(line[6:])
+                            if frame.get("done"):
+                                reply = frame
+                                if frame.get("error"):
+                                    status = 599
+                else:
+                    response = client.post("/chat", content=payload, headers={"Content-Type": "application/json"})
+                    status = response.status_code
+                    response_bytes = len(response.content)
+                    reply = response.json()
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latency = time.perf_counter() - start
+
+            results.append({
+                "turn": turn + 1,
+                "status": status,
+                "latency": latency,
+                "ttft": ttft if ttft is not None else latency,
+                "request_bytes": len(payload),
+                "response_bytes": response_bytes,
+            })
+
+            if status != 200 or reply is None:
+                return
+            if args.mode == "history":
+                history = reply.get("history", history)
+            else:
+                session_id = reply.get("session_id", session_id)
+
+
+def start_servers(args):
+    fake_port = free_port()
+    app_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"),
+        "--port", str(fake_port),
+        "--latency", str(args.fake_latency),
+        "--tokens-per-second", str(args.fake_tokens_per_second),
+        "--reply-tokens", str(args.fake_reply_tokens),
+        "--error-rate", str(args.fake_error_rate),
+    ], stdout=subprocess.DEVNULL)
+
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY="fake",
+        GROQ_API_KEY="fake",
+        GEMINI_API_ENDPOINT=fake_url,
+        GROQ_BASE_URL=fake_url,
+        LLM_PROVIDERS=args.providers,
+        MAX_IN_FLIGHT=str(max(args.users * 2, 100)),
+    )
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{app_port}", "app:app"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(app_port), "--with-threads"]
+    app = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        wait_for(f"{fake_url}/")
+        wait_for(f"{base_url}/cache-stats")
+        warm_up(base_url, args)
+    except RuntimeError:
+        stop(fake, app)
+        raise
+    return fake, app, base_url
+
+
+def warm_up(base_url, args):
+    # Model clients are imported and connected on the first model call (see
+    # llm.py); make that call now so it isn't counted against the first
+    # conversation's latency and the server's CPU per request.
+    path = "/chat/stream" if args.stream else "/chat"
+    response = httpx.post(f"{base_url}{path}", json={"message": "hello", "history": []}, timeout=args.request_timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"Warm-up request to {path} failed with {response.status_code}")
+
+
+def stop(*processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run(args):
+    fake, app, base_url = start_servers(args)
+    try:
+        results = []
+        peak_rss = [rss_bytes(app.pid)]
+        done = threading.Event()
+
+        def sample_rss():
+            while not done.wait(0.2):
+                peak_rss[0] = max(peak_rss[0], rss_bytes(app.pid))
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        cpu_before = cpu_seconds(app.pid)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            for user in range(args.users):
+                pool.submit(run_conversation, base_url, user, args, results)
+        elapsed = time.perf_counter() - start
+        cpu_used = cpu_seconds(app.pid) - cpu_before
+        done.set()
+    finally:
+        stop(fake, app)
+
+    ok = [r for r in results if r["status"] == 200]
+    errors = {}
+    for r in results:
+        if r["status"] != 200:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+
+    by_turn = []
+    for turn in range(1, args.turns + 1):
+        rows = [r for r in ok if r["turn"] == turn]
+        if rows:
+            by_turn.append({
+                "turn": turn,
+                "latency_ms_p50": percentiles([r["latency"] * 1000 for r in rows])["p50"],
+                "request_bytes_mean": sum(r["request_bytes"] for r in rows) / len(rows),
+            })
+
+    return {
+        "config": {
+            "users": args.users,
+            "turns": args.turns,
+            "mode": args.mode,
+            "stream": args.stream,
+            "server": args.server,
+            "providers": args.providers,
+            "fake_latency": args.fake_latency,
+            "fake_tokens_per_second": args.fake_tokens_per_second,
+            "fake_reply_tokens": args.fake_reply_tokens,
+            "fake_error_rate": args.fake_error_rate,
+        },
+        "requests": len(results),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": percentiles([r["latency"] * 1000 for r in ok]),
+        "ttft_ms": percentiles([r["ttft"] * 1000 for r in ok]),
+        "request_bytes": percentiles([r["request_bytes"] for r in ok]),
+        "response_bytes": percentiles([r["response_bytes"] for r in ok]),
+        "server": {
+            "cpu_ms_per_request": cpu_used * 1000 / len(results) if results else None,
+            "peak_rss_mb": peak_rss[0] / (1024 * 1024),
+        },
+        "by_turn": by_turn,
+    }
+
+
+def lookup(report, path):
+    value = report
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for path, higher_is_better in COMPARED.items():
+        new, old = lookup(report, path), lookup(baseline, path)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        print(f"{path:28} {old:12.2f} -> {new:12.2f} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(path)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend against a fake LLM API")
+    parser.add_argument("--users", type=int, default=20, help="concurrent conversations")
+    parser.add_argument("--turns", type=int, default=8, help="messages per conversation")
+    parser.add_argument("--mode", choices=("session", "history"), default="session",
+                        help="send a session id, or resend the full history like older clients")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream")
+    parser.add_argument("--server", choices=("flask", "gunicorn"), default="flask")
+    parser.add_argument("--providers", default="gemini", help="LLM_PROVIDERS for the app")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--fake-latency", type=float, default=0.3)
+    parser.add_argument("--fake-tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--fake-reply-tokens", type=int, default=60)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the report here, e.g. bench/baseline.json")
+    parser.add_argument("--compare", help="baseline report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change before failing")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+def estimate_tokens(text):
+    # Rough local estimate (~4 characters per token); good enough for budgeting
+    # without a count_tokens round trip.
+    return len(text) // 4 + 1
+
+
+def history_tokens(history):
+    return sum(estimate_tokens(msg["parts"]) for msg in history)
+
+
+class ContextWindow:
+    # Keeps a conversation's history under max_tokens. Once the budget is
+    # exceeded, the oldest turns are dropped down to low_watermark * max_tokens
+    # and folded into the conversation's rolling summary, so summarizing only
+    # happens every so often rather than on every turn.
+    def __init__(self, max_tokens=6000, low_watermark=0.5, summarize=None):
+        self.max_tokens = max_tokens
+        self.low_watermark = low_watermark
+        self.summarize = summarize
+
+    def _cut(self, history, summary):
+        # Number of leading messages to drop, 0 while within budget
+        total = history_tokens(history) + estimate_tokens(summary)
+        if total <= self.max_tokens:
+            return 0
+
+        target = int(self.max_tokens * self.low_watermark)
+        cut = 0
+        # Drop whole user/assistant pairs so the history keeps alternating roles
+        while cut + 2 <= len(history) and total > target:
+            total -= estimate_tokens(history[cut]["parts"]) + estimate_tokens(history[cut + 1]["parts"])
+            cut += 2
+        return cut
+
+    def trim(self, history):
+        # Model-facing copy of a history that the caller keeps in full (e.g. a
+        # stateless client's), with old turns dropped and nothing summarized
+        return history[self._cut(history, ""):]
+
+    def fit(self, conversation, summarize=True):
+        history = conversation.history
+        cut = self._cut(history, conversation.summary)
+        if cut == 0:
+            return 0
+
+        dropped = history[:cut]
+        if summarize and self.summarize is not None:
+            conversation.summary = self.summarize(conversation.summary, dropped)
+        conversation.history = history[cut:]
+        return cut
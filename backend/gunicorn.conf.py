@@ -0,0 +1,16 @@
+import os
+
+# Model calls are network-bound, so each worker serves many requests on
+# threads instead of one at a time. Keep MAX_IN_FLIGHT (app.py) below threads
+# so overload is rejected with a 503 rather than queued on the socket.
+#
+# Sessions live in each worker's memory (SESSION_STORE=sqlite also keeps a
+# per-worker cache in front of the database), so session mode needs one
+# worker; scale with threads. With more workers, clients fall back to
+# resending their history whenever they reach a worker that doesn't know them.
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 128))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+keepalive = 5
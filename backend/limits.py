@@ -0,0 +1,43 @@
+import threading
+
+
+class Overloaded(Exception):
+    pass
+
+
+class ConversationBusy(Exception):
+    pass
+
+
+class ConcurrencyLimiter:
+    # Caps the number of model calls in flight. Requests that can't get a slot
+    # within max_wait seconds fail fast with Overloaded instead of queueing
+    # behind the slow upstream.
+    def __init__(self, max_in_flight=256, max_wait=0.0):
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def acquire(self):
+        if self.max_wait > 0:
+            acquired = self._slots.acquire(timeout=self.max_wait)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            raise Overloaded(f"More than {self.max_in_flight} requests in flight")
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
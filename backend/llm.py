@@ -0,0 +1,573 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger("chatbot.llm")
+
+# Every provider speaks the /chat history format: a list of
+# {"role": "user" | "assistant", "parts": text} messages. unhealthy(error)
+# says whether an error is the provider's fault (timeouts, connection errors,
+# 5xx) rather than the request's (a 400, a safety block, an empty reply).
+
+
+class ProviderTimeout(Exception):
+    pass
+
+
+def remaining(deadline):
+    # Seconds left before a time.monotonic() deadline (None: no deadline)
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise ProviderTimeout("Request deadline exceeded")
+    return left
+
+
+class Reply:
+    def __init__(self, text, usage, provider):
+        self.text = text
+        self.usage = usage
+        self.provider = provider
+
+
+class StreamReply:
+    # Iterates over text chunks as they arrive. text and usage are filled in
+    # once the stream is exhausted. Past deadline (set by the router) the
+    # stream is abandoned: HTTP clients only time out individual reads, so a
+    # reply that keeps trickling in would otherwise never time out.
+    def __init__(self, chunks, provider, usage=None):
+        self._chunks = iter(chunks)
+        self._usage = usage
+        self._buffer = []
+        self.provider = provider
+        self.deadline = None
+        self.text = ""
+        self.usage = None
+
+    def prime(self):
+        # Pull the first chunk so connection errors surface before the caller
+        # has sent anything to its own client.
+        self._buffer.extend(itertools.islice(self._chunks, 1))
+
+    def __iter__(self):
+        parts = []
+        buffered, self._buffer = self._buffer, []
+        for chunk in itertools.chain(buffered, self._chunks):
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                getattr(self._chunks, "close", lambda: None)()
+                raise ProviderTimeout(f"{self.provider} stream exceeded the request deadline")
+            parts.append(chunk)
+            yield chunk
+        self.text = "".join(parts)
+        self.usage = self._usage() if self._usage else None
+
+
+def usage_dict(prompt_tokens, completion_tokens):
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class GeminiProvider:
+    # Gemini through google.generativeai (gRPC). The library and its
+    # grpc/protobuf stack are only imported on first use.
+    name = "gemini"
+
+    def __init__(self, api_key, model_name="gemini-1.5-flash", api_endpoint=None):
+        self.api_key = api_key
+        self.api_endpoint = api_endpoint
+        self.model_name = model_name
+        self._genai = None
+        self._lock = threading.Lock()
+        # One GenerativeModel per system instruction; they share the
+        # library's gRPC channel.
+        self._models = {}
+
+    def _setup(self):
+        if self._genai is not None:
+            return
+        with self._lock:
+            if self._genai is not None:
+                return
+            import google.generativeai as genai
+            from google.api_core import exceptions as google_exceptions
+
+            if self.api_endpoint:
+                # Custom endpoints (e.g. bench/fake_llm.py) are spoken to over REST
+                genai.configure(
+                    api_key=self.api_key, transport="rest", client_options={"api_endpoint": self.api_endpoint}
+                )
+            else:
+                genai.configure(api_key=self.api_key)
+            self._timeout_errors = (google_exceptions.DeadlineExceeded, TimeoutError)
+            # OSError covers the connection errors of the REST transport
+            self._outage_errors = (google_exceptions.ServerError, google_exceptions.RetryError, OSError)
+            self._genai = genai
+
+    def warm(self):
+        self._setup()
+
+    def unhealthy(self, error):
+        self._setup()
+        return isinstance(error, self._outage_errors)
+
+    def _model(self, system):
+        self._setup()
+        model = self._models.get(system)
+        if model is None:
+            model = self._genai.GenerativeModel(self.model_name, system_instruction=system)
+            self._models[system] = model
+        return model
+
+    def _start(self, system, history):
+        return self._model(system).start_chat(history=[
+            {"role": "user" if msg["role"] == "user" else "model", "parts": msg["parts"]}
+            for msg in history
+        ])
+
+    def _usage(self, response):
+        usage = response.usage_metadata
+        return usage_dict(usage.prompt_token_count, usage.candidates_token_count)
+
+    def generate(self, system, history, message, timeout=None):
+        chat = self._start(system, history)
+        try:
+            response = chat.send_message(
+                message, request_options={"timeout": timeout} if timeout else None
+            )
+        except self._timeout_errors as e:
+            raise ProviderTimeout(str(e)) from e
+        return Reply(response.text, self._usage(response), self.name)
+
+    def stream(self, system, history, message, timeout=None):
+        chat = self._start(system, history)
+        response = None
+
+        def chunks():
+            nonlocal response
+            try:
+                response = chat.send_message(
+                    message, stream=True, request_options={"timeout": timeout} if timeout else None
+                )
+                for chunk in response:
+                    if chunk.text:
+                        yield chunk.text
+            except self._timeout_errors as e:
+                raise ProviderTimeout(str(e)) from e
+
+        return StreamReply(chunks(), self.name, lambda: self._usage(response))
+
+
+class GeminiHTTPProvider:
+    # Gemini over its REST API with a plain pooled httpx client. Much cheaper
+    # to import than the gRPC stack, which matters for serverless cold starts,
+    # and it streams with SSE.
+    name = "gemini"
+
+    def __init__(self, api_key, model_name="gemini-1.5-flash", api_endpoint=None, max_connections=100):
+        self.api_key = api_key
+        self.base_url = (api_endpoint or "https://generativelanguage.googleapis.com").rstrip("/")
+        self.model_name = model_name
+        self.max_connections = max_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _http(self):
+        # Also sets self._httpx, which unhealthy() relies on
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+
+                    self._httpx = httpx
+                    self._client = httpx.Client(
+                        base_url=self.base_url,
+                        headers={"x-goog-api-key": self.api_key},
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        ),
+                    )
+        return self._client
+
+    def warm(self):
+        # Open a pooled connection (DNS + TLS) ahead of the first chat
+        try:
+            self._http().get(f"/v1beta/models/{self.model_name}", timeout=5.0)
+        except Exception as e:
+            logger.warning(f"Warming {self.name} failed: {type(e).__name__}: {e}")
+
+    def unhealthy(self, error):
+        httpx = self._httpx
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError)
+
+    def _body(self, system, history, message):
+        body = {"contents": [
+            {"role": "user" if msg["role"] == "user" else "model", "parts": [{"text": msg["parts"]}]}
+            for msg in history
+        ] + [{"role": "user", "parts": [{"text": message}]}]}
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": system}]}
+        return body
+
+    def _text(self, payload):
+        candidates = payload.get("candidates") or []
+        if not candidates:
+            raise ValueError(f"Gemini returned no candidates: {payload.get('promptFeedback')}")
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    def _usage(self, payload):
+        usage = payload.get("usageMetadata", {})
+        return usage_dict(usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+    def generate(self, system, history, message, timeout=None):
+        client = self._http()
+        try:
+            response = client.post(
+                f"/v1beta/models/{self.model_name}:generateContent",
+                json=self._body(system, history, message),
+                timeout=timeout,
+            )
+        except self._httpx.TimeoutException as e:
+            raise ProviderTimeout(str(e)) from e
+        response.raise_for_status()
+        payload = response.json()
+        return Reply(self._text(payload), self._usage(payload), self.name)
+
+    def stream(self, system, history, message, timeout=None):
+        client = self._http()
+        usage = {}
+
+        def chunks():
+            try:
+                with client.stream(
+                    "POST",
+                    f"/v1beta/models/{self.model_name}:streamGenerateContent",
+                    params={"alt": "sse"},
+                    json=self._body(system, history, message),
+                    timeout=timeout,
+                ) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        payload = json.loads(line[5:])
+                        usage.update(self._usage(payload))
+                        text = self._text(payload)
+                        if text:
+                            yield text
+            except self._httpx.TimeoutException as e:
+                raise ProviderTimeout(str(e)) from e
+
+        return StreamReply(chunks(), self.name, lambda: usage or usage_dict(0, 0))
+
+
+class GroqProvider:
+    # Groq's SDK (and its pooled httpx client) is created on first use.
+    name = "groq"
+
+    def __init__(self, api_key, model_name="llama3-8b-8192", max_connections=100):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.max_connections = max_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import groq
+                    import httpx
+
+                    self._timeout_errors = (groq.APITimeoutError,)
+                    self._outage_errors = (groq.APIConnectionError, groq.InternalServerError)
+                    # A single pooled HTTP client per process; retries are left
+                    # to the router so a failing provider is abandoned quickly.
+                    self._client = groq.Groq(
+                        api_key=self.api_key,
+                        max_retries=0,
+                        http_client=httpx.Client(limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        )),
+                    )
+        return self._client
+
+    def warm(self):
+        self.client
+
+    def unhealthy(self, error):
+        self.client
+        return isinstance(error, self._outage_errors)
+
+    def _messages(self, system, history, message):
+        messages = [{"role": "system", "content": system}] if system else []
+        messages += [{"role": msg["role"], "content": msg["parts"]} for msg in history]
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def generate(self, system, history, message, timeout=None):
+        client = self.client
+        try:
+            completion = client.chat.completions.create(
+                messages=self._messages(system, history, message),
+                model=self.model_name,
+                timeout=timeout,
+            )
+        except self._timeout_errors as e:
+            raise ProviderTimeout(str(e)) from e
+        usage = completion.usage
+        return Reply(
+            completion.choices[0].message.content,
+            usage_dict(usage.prompt_tokens, usage.completion_tokens),
+            self.name,
+        )
+
+    def stream(self, system, history, message, timeout=None):
+        client = self.client
+        usage = {}
+
+        def chunks():
+            try:
+                response = client.chat.completions.create(
+                    messages=self._messages(system, history, message),
+                    model=self.model_name,
+                    timeout=timeout,
+                    stream=True,
+                )
+                for chunk in response:
+                    x_groq = getattr(chunk, "x_groq", None)
+                    if x_groq is not None and x_groq.usage is not None:
+                        usage.update(usage_dict(x_groq.usage.prompt_tokens, x_groq.usage.completion_tokens))
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except self._timeout_errors as e:
+                raise ProviderTimeout(str(e)) from e
+
+        return StreamReply(chunks(), self.name, lambda: usage or usage_dict(0, 0))
+
+
+class LatencyStats:
+    def __init__(self, window=200, alpha=0.2):
+        self.alpha = alpha
+        self.ewma = None
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+
+    def quantile(self, q):
+        with self._lock:
+            if len(self._samples) < 20:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class Router:
+    # Sends each call to the fastest healthy provider (by EWMA latency) and
+    # fails over to the next one on errors or timeouts. A provider that times
+    # out (given a fair share of time), can't be reached or answers 5xx is
+    # tried last for cooldown seconds; errors caused by the request itself
+    # only fail over that one call.
+    # Latency is tracked separately for generate (full reply) and stream
+    # (first chunk). With hedge=True a non-streaming call that hasn't answered
+    # by the primary's p95 latency is also sent to the next provider, and
+    # whichever answers first wins.
+    #
+    # timeout (or an absolute time.monotonic() deadline) covers the whole
+    # call, failovers and hedges included: each provider only gets what is
+    # left of it.
+    def __init__(self, providers, hedge=False, hedge_after=2.0, cooldown=30.0, max_in_flight=100):
+        if not providers:
+            raise EnvironmentError("No LLM provider is configured.")
+        self.providers = providers
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.cooldown = cooldown
+        self.stats = {
+            (provider.name, method): LatencyStats()
+            for provider in providers
+            for method in ("generate", "stream")
+        }
+        self.failed_until = {provider.name: 0.0 for provider in providers}
+        # Room for a primary and a hedge per in-flight call. Calls only go to
+        # the executor while a worker is free (losers of a hedge keep theirs
+        # until they finish), so nothing queues out of the limiter's sight.
+        workers = 2 * max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-hedge")
+        self._workers = threading.BoundedSemaphore(workers)
+
+    def warm(self):
+        # Import and connect every provider ahead of the first request
+        for provider in self.providers:
+            provider.warm()
+
+    def ordered(self, method="generate"):
+        now = time.monotonic()
+
+        def rank(item):
+            index, provider = item
+            stats = self.stats[provider.name, method]
+            # Healthy first, then by observed latency, with providers that
+            # have no measurements yet last in configured order.
+            return (self.failed_until[provider.name] > now, stats.ewma is None, stats.ewma or 0.0, index)
+
+        return [provider for _, provider in sorted(enumerate(self.providers), key=rank)]
+
+    def _call(self, provider, method, system, history, message, deadline):
+        timeout = remaining(deadline)
+        start = time.monotonic()
+        try:
+            result = getattr(provider, method)(system, history, message, timeout)
+            if method == "stream":
+                result.deadline = deadline
+                result.prime()
+        except Exception as e:
+            if isinstance(e, ProviderTimeout):
+                unhealthy = self._had_time(provider, method, timeout)
+            else:
+                unhealthy = provider.unhealthy(e)
+            if unhealthy:
+                self.failed_until[provider.name] = time.monotonic() + self.cooldown
+            raise
+        self.stats[provider.name, method].record(time.monotonic() - start)
+        return result
+
+    def _had_time(self, provider, method, timeout):
+        # A timeout only counts against the provider if it was given at least
+        # its median latency (or hedge_after before there is enough data).
+        # Otherwise the request had already spent its deadline elsewhere.
+        if timeout is None:
+            return True
+        stats = self.stats[provider.name, method]
+        return timeout >= (stats.quantile(0.5) or stats.ewma or self.hedge_after)
+
+    def generate(self, system, history, message, timeout=None, deadline=None):
+        if deadline is None and timeout is not None:
+            deadline = time.monotonic() + timeout
+        providers = self.ordered("generate")
+        if self.hedge and len(providers) > 1:
+            primary = self._submit(providers[0], system, history, message, deadline)
+            if primary is not None:
+                return self._hedged(primary, providers, system, history, message, deadline)
+
+        return self._failover(providers, system, history, message, deadline)
+
+    def _failover(self, providers, system, history, message, deadline):
+        error = None
+        for provider in providers:
+            remaining(deadline)  # out of time: don't start on the next provider
+            try:
+                return self._call(provider, "generate", system, history, message, deadline)
+            except Exception as e:
+                logger.warning(f"{provider.name} failed: {type(e).__name__}: {e}")
+                error = e
+        raise error
+
+    def stream(self, system, history, message, timeout=None, deadline=None):
+        # Failover only happens before the first chunk; once text has reached
+        # the client the stream is committed to that provider.
+        if deadline is None and timeout is not None:
+            deadline = time.monotonic() + timeout
+        error = None
+        for provider in self.ordered("stream"):
+            remaining(deadline)
+            try:
+                return self._call(provider, "stream", system, history, message, deadline)
+            except Exception as e:
+                logger.warning(f"{provider.name} failed: {type(e).__name__}: {e}")
+                error = e
+        raise error
+
+    def _submit(self, provider, system, history, message, deadline):
+        # None when every worker is busy; the caller then goes without a hedge
+        if not self._workers.acquire(blocking=False):
+            return None
+        future = self._executor.submit(self._call, provider, "generate", system, history, message, deadline)
+        future.add_done_callback(lambda _: self._workers.release())
+        return future
+
+    def _hedged(self, primary, providers, system, history, message, deadline):
+        hedge_after = self.stats[providers[0].name, "generate"].quantile(0.95) or self.hedge_after
+
+        done, pending = wait({primary}, timeout=hedge_after)
+        backups = providers[1:]
+
+        error = None
+        while True:
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning(f"Hedged call failed: {type(e).__name__}: {e}")
+                    error = e
+            # Primary is slow or failed: bring in the next provider
+            if backups:
+                future = self._submit(backups[0], system, history, message, deadline)
+                if future is not None:
+                    backups.pop(0)
+                    pending.add(future)
+                elif not pending:
+                    return self._failover(backups, system, history, message, deadline)
+            if not pending:
+                raise error
+            done, pending = wait(pending, timeout=remaining(deadline), return_when=FIRST_COMPLETED)
+
+
+def create_router(default_providers="gemini,groq"):
+    names = os.environ.get("LLM_PROVIDERS", default_providers).split(",")
+    max_connections = int(os.environ.get("MAX_IN_FLIGHT", 100))
+
+    # The httpx transport skips the grpc/protobuf imports, so it is the
+    # default where cold starts matter (Vercel sets VERCEL=1).
+    gemini_transport = os.environ.get("GEMINI_TRANSPORT", "httpx" if os.environ.get("VERCEL") else "grpc")
+
+    providers = []
+    for name in (name.strip() for name in names):
+        if name == "gemini" and os.environ.get("GEMINI_API_KEY"):
+            if gemini_transport == "httpx":
+                providers.append(GeminiHTTPProvider(
+                    os.environ["GEMINI_API_KEY"],
+                    os.environ.get("GEMINI_MODEL", "gemini-1.5-flash"),
+                    api_endpoint=os.environ.get("GEMINI_API_ENDPOINT"),
+                    max_connections=max_connections,
+                ))
+            else:
+                providers.append(GeminiProvider(
+                    os.environ["GEMINI_API_KEY"],
+                    os.environ.get("GEMINI_MODEL", "gemini-1.5-flash"),
+                    api_endpoint=os.environ.get("GEMINI_API_ENDPOINT"),
+                ))
+        elif name == "groq" and os.environ.get("GROQ_API_KEY"):
+            providers.append(GroqProvider(
+                os.environ["GROQ_API_KEY"],
+                os.environ.get("GROQ_MODEL", "llama3-8b-8192"),
+                max_connections=max_connections,
+            ))
+
+    return Router(
+        providers,
+        hedge=os.environ.get("LLM_HEDGE", "0") == "1",
+        hedge_after=float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", 2.0)),
+        cooldown=float(os.environ.get("LLM_COOLDOWN_SECONDS", 30.0)),
+        max_in_flight=max_connections,
+    )
@@ -0,0 +1,255 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+
+# Minimal Prometheus-compatible metrics (text exposition format 0.0.4). Values
+# are per process; with several gunicorn workers each one is scraped alone.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+HISTORY_BUCKETS = (0, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_label_text(self.labels, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _label_text(self.labels + ("le",), key + (bound,))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_bucket{_label_text(self.labels + ('le',), key + ('+Inf',))} {count}")
+        lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+        lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+request_duration = REGISTRY.histogram(
+    "chat_request_duration_seconds", "Time from request start to the end of the response.", ("endpoint", "status"))
+stage_duration = REGISTRY.histogram(
+    "chat_stage_duration_seconds", "Time spent in each stage of a chat request.", ("stage",))
+time_to_first_token = REGISTRY.histogram(
+    "chat_time_to_first_token_seconds", "Time until the first streamed chunk is sent.")
+requests_in_flight = REGISTRY.gauge(
+    "chat_requests_in_flight", "Requests currently being handled.")
+model_calls_in_flight = REGISTRY.gauge(
+    "chat_model_calls_in_flight", "Model calls currently holding a concurrency slot.")
+tokens = REGISTRY.histogram(
+    "chat_tokens_per_request", "Model tokens used per request.", ("kind", "provider"), buckets=TOKEN_BUCKETS)
+history_length = REGISTRY.histogram(
+    "chat_history_messages", "Messages in the conversation history at request time.", buckets=HISTORY_BUCKETS)
+errors = REGISTRY.counter(
+    "chat_errors_total", "Errors raised while handling chat requests.", ("type",))
+cache_lookups = REGISTRY.counter(
+    "chat_response_cache_lookups_total", "Response cache lookups, by result.", ("result",))
+
+
+class RequestTimer:
+    # Times named stages of one request, both into stage_duration and into a
+    # per-request dict for the structured log line.
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def span(self, stage):
+        return _Span(self, stage)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+class _Span:
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.timer.stages[self.stage] = self.timer.stages.get(self.stage, 0.0) + seconds
+        stage_duration.observe(seconds, stage=self.stage)
+
+
+class StackSampler:
+    # Opt-in sampling profiler for one request: records the handling thread's
+    # stack every SAMPLE_INTERVAL seconds while started. Stacks are kept in
+    # folded form ("a;b;c count"), ready for flamegraph tools. All samplers
+    # share one background thread (see _SamplerThread).
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.samples = collections.Counter()
+
+    def start(self):
+        _sampler_thread.add(self)
+        return self
+
+    def stop(self):
+        _sampler_thread.remove(self)
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+SAMPLE_INTERVAL = 0.005
+
+
+class _SamplerThread:
+    # One thread samples every active StackSampler, so profiling costs one
+    # sys._current_frames() call per interval however many requests are in
+    # flight. It idles while there are none.
+    def __init__(self, interval):
+        self.interval = interval
+        self._samplers = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = None
+
+    def add(self, sampler):
+        with self._lock:
+            self._samplers[sampler.thread_id] = sampler
+            self._active.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="stack-sampler")
+                self._thread.start()
+
+    def remove(self, sampler):
+        # Holding the lock while sampling means no sample lands after this
+        with self._lock:
+            if self._samplers.get(sampler.thread_id) is sampler:
+                del self._samplers[sampler.thread_id]
+            if not self._samplers:
+                self._active.clear()
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._samplers:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, sampler in self._samplers.items():
+                    stack = []
+                    frame = frames.get(thread_id)
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    if stack:
+                        sampler.samples[";".join(reversed(stack))] += 1
+
+
+_sampler_thread = _SamplerThread(SAMPLE_INTERVAL)
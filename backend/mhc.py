@@ -1,50 +1,54 @@
-import os
-from groq import Groq
+from context import ContextWindow
+from llm import create_router
+from safety import CRISIS_REPLY, screen, tag_flagged, tagged
+from sessions import Conversation
 
-# Initialize the client with the API key
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
+# Groq first, Gemini as failover (see LLM_PROVIDERS / LLM_HEDGE in llm.py)
+router = create_router("groq,gemini")
+
+system_prompt = (
+    "You are a chatbot designed to provide mental health support by engaging in empathetic, conversational interactions. "
+    "Your goal is to offer calming, compassionate, and non-judgmental advice to help users through emotionally charged or stressful situations. "
+    "Keep your language simple, warm, and reassuring, while promoting self-care and positivity."
 )
 
-# Start a chat loop
-conversation = [
-    {
-        "role": "user",
-        "content": (
-            "You are a chatbot designed to provide mental health support by engaging in empathetic, conversational interactions. "
-            "Your goal is to offer calming, compassionate, and non-judgmental advice to help users through emotionally charged or stressful situations. "
-            "Keep your language simple, warm, and reassuring, while promoting self-care and positivity."
-        )
-    }
-]
+# Keep the replayed history bounded instead of resending the whole conversation
+context_window = ContextWindow(max_tokens=6000)
+conversation = Conversation(None)
 
 print("Chatbot: Hello! I'm here to listen and offer support. How are you feeling today? (Type 'exit' to quit)\n")
 
 while True:
     user_input = input("You: ")
-    
+
     if user_input.lower() in ['exit', 'quit']:
         print("Chatbot: Take care of yourself. Remember, I'm here if you need someone to talk to. 💙")
         break
 
-    # Append user message to the conversation
-    conversation.append({
-        "role": "user",
-        "content": user_input
-    })
-    
-    # Get chatbot response
-    chat_completion = client.chat.completions.create(
-        messages=conversation,
-        model="llama3-8b-8192",
+    # Crisis messages get helpline information immediately, without a model call
+    screening = screen(user_input)
+    if screening.crisis:
+        print(f"\nChatbot: {CRISIS_REPLY}\n")
+        conversation.history.append({"role": "user", "parts": user_input, "crisis": True})
+        conversation.history.append({"role": "assistant", "parts": CRISIS_REPLY})
+        continue
+
+    context_window.fit(conversation)
+
+    # Get chatbot response, streamed as it is generated
+    print("\nChatbot: ", end="", flush=True)
+    reply = router.stream(
+        system_prompt,
+        tag_flagged(conversation.history),
+        tagged(user_input) if screening.flagged else user_input,
     )
-    
-    # Get assistant's response
-    response = chat_completion.choices[0].message.content
-    print(f"\nChatbot: {response}\n")
-
-    # Append the assistant's message to maintain conversation history
-    conversation.append({
-        "role": "assistant",
-        "content": response
-    })
+    for chunk in reply:
+        print(chunk, end="", flush=True)
+    print("\n")
+
+    # Append both messages to maintain conversation history
+    if screening.flagged:
+        conversation.history.append({"role": "user", "parts": user_input, "crisis": True})
+    else:
+        conversation.history.append({"role": "user", "parts": user_input})
+    conversation.history.append({"role": "assistant", "parts": reply.text})
@@ -0,0 +1,136 @@
+import math
+import re
+import threading
+from collections import Counter
+
+from cachetools import TTLCache
+
+_apostrophes = re.compile(r"['\u2019]")
+_non_word = re.compile(r"[^\w\s]+")
+_spaces = re.compile(r"\s+")
+
+
+def normalize(text):
+    text = _apostrophes.sub("", text.lower())
+    text = _non_word.sub(" ", text)
+    return _spaces.sub(" ", text).strip()
+
+
+def ngram_vector(text, n=3):
+    # Unit-length character n-gram counts, padded so short words still count
+    padded = f" {text} "
+    grams = Counter(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+    norm = math.sqrt(sum(count * count for count in grams.values()))
+    return {gram: count / norm for gram, count in grams.items()}
+
+
+# Words two messages may differ in and still get the same reply. Every other
+# word counts, because one word can change who or what a message is about
+# while barely changing its n-grams ("my mom" vs "my dad", "better" vs
+# "bitter", "anxious" vs "not anxious"). Apostrophes are already gone.
+FILLER_WORDS = frozenset((
+    "a", "about", "am", "an", "and", "are", "been", "being", "bit", "feel", "feeling", "hello", "hey", "hi",
+    "i", "im", "is", "ive", "just", "kind", "kinda", "lately", "little", "me", "my", "of", "please", "pretty",
+    "quite", "really", "so", "somewhat", "the", "these", "this", "to", "today", "very", "was",
+))
+
+
+def content_words(text):
+    # In order, so "my mom hit my dad" and "my dad hit my mom" differ
+    return tuple(word for word in text.split() if word not in FILLER_WORDS)
+
+
+class _Entries(TTLCache):
+    # TTLCache that reports expired and evicted keys, so the similarity
+    # index can forget them as well.
+    def __init__(self, maxsize, ttl, on_remove):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._on_remove = on_remove
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, _ in expired:
+            self._on_remove(key)
+        return expired
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._on_remove(key)
+        return key, value
+
+
+class ResponseCache:
+    # Replies to opening messages, keyed by normalized text. Lookups try an
+    # exact match first, then the most similar cached message with the same
+    # content words, by n-gram cosine similarity, if it clears the threshold.
+    # Entries expire after ttl seconds and the least recently used ones are
+    # evicted beyond maxsize.
+    #
+    # Entries are indexed by their content words (tuple -> {key: vector}),
+    # so a lookup only scores the entries it could match at all.
+    #
+    # on_lookup, if given, is called with "exact_hit", "similar_hit" or "miss"
+    # after every lookup (outside the cache lock).
+    def __init__(self, maxsize=512, ttl=3600, threshold=0.8, on_lookup=None):
+        self.threshold = threshold
+        self._on_lookup = on_lookup
+        self._entries = _Entries(maxsize, ttl, self._unindex)
+        self._index = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _unindex(self, key):
+        words = content_words(key)
+        bucket = self._index.get(words)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._index[words]
+
+    def lookup(self, message):
+        result, reply = self._lookup(message)
+        if self._on_lookup is not None:
+            self._on_lookup(result)
+        return reply
+
+    def _lookup(self, message):
+        key = normalize(message)
+        vector = ngram_vector(key)
+        with self._lock:
+            reply = self._entries.get(key)
+            if reply is not None:
+                self.exact_hits += 1
+                return "exact_hit", reply
+
+            self._entries.expire()
+            best, best_score = None, self.threshold
+            for candidate, candidate_vector in self._index.get(content_words(key), {}).items():
+                score = sum(weight * candidate_vector.get(gram, 0.0) for gram, weight in vector.items())
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if best is not None:
+                self.similar_hits += 1
+                return "similar_hit", self._entries[best]
+
+            self.misses += 1
+            return "miss", None
+
+    def store(self, message, reply):
+        key = normalize(message)
+        vector = ngram_vector(key)
+        with self._lock:
+            self._entries[key] = reply
+            self._index.setdefault(content_words(key), {})[key] = vector
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,355 @@
+import math
+import os
+import re
+
+# Local crisis pre-screen. It runs before any model call and has two stages,
+# both built once at import time:
+#   1. compiled phrase automata: explicit statements of suicidal intent or
+#      self-harm mark a message as a crisis, while phrases that also have
+#      everyday meanings ("I cut myself while cooking") only flag it;
+#   2. a small linear model over word unigrams and bigrams, which flags
+#      indirect wording ("everyone would be better off without me").
+#
+# Only a phrase match is a crisis and gets CRISIS_REPLY straight away. The
+# model is too coarse to stand in for the reply on its own, so a flagged
+# message still goes to the model, tagged so it can check in and offer
+# resources if needed.
+
+CRISIS_PHRASES = (
+    r"suicid\w*",
+    r"kill(?:ing)? my ?self",
+    r"end(?:ing)? (?:my|it) (?:life|all)",
+    r"end it all",
+    r"tak(?:e|ing) my (?:own )?life",
+    r"(?:want|ready|deserve) to die",
+    r"wanna die",
+    r"(?:and|to) never wake(?: up)?",
+    r"never (?:want to )?wake up again",
+    r"(?:hope|wish|pray) (?:that )?i (?:never|don'?t|won'?t|wouldn'?t) wake up",
+    r"don'?t (?:ever )?want to (?:ever )?wake up (?:again|ever)",
+    r"wish i (?:was|were) dead",
+    r"better off dead",
+    r"no reason to (?:live|go on)",
+    r"don'?t want to (?:be alive|exist|live anymore)",
+    r"self[- ]?harm\w*",
+    r"(?:harm|harming) my ?self",
+    r"(?:want|going|need) to (?:hurt|cut|harm) my ?self",
+    r"overdos\w*",
+    r"(?:sick|tired) of (?:living|being alive)(?! (?:in|with|at|on|near|under|like|here|there)\b)",
+    r"took (?:a bunch of|all (?:of )?my) pills",
+)
+
+AMBIGUOUS_PHRASES = (
+    r"(?:hurt|hurting|cut|cutting) my ?self",
+    r"going to die",
+    r"never wake up",
+    r"don'?t want to (?:live|wake up)",
+)
+
+
+def _automaton(phrases):
+    return re.compile(r"\b(?:" + "|".join(phrases) + r")\b", re.IGNORECASE)
+
+
+_phrase_automaton = _automaton(CRISIS_PHRASES)
+_ambiguous_automaton = _automaton(AMBIGUOUS_PHRASES)
+
+# Feature weights for the scoring model. A message scores
+# sigmoid(BIAS + sum of weights of the features it contains). Fitted by
+# bench/fit_crisis_model.py on bench/crisis_train.jsonl; refit rather than
+# hand-editing, and check bench/crisis_screen.py on the held-out set.
+FEATURE_WEIGHTS = {
+    "goodbye": 1.36,
+    "for good": 1.23,
+    "die": 1.17,
+    "pills": 1.15,
+    "myself": 1.14,
+    "i died": 1.1,
+    "end it": 1.09,
+    "living": 1.06,
+    "gone": 1.03,
+    "existing": 1.02,
+    "everyone": 1.01,
+    "without me": 0.94,
+    "death": 0.93,
+    "world": 0.92,
+    "suicidal": 0.89,
+    "be alive": 0.88,
+    "forever": 0.88,
+    "feelings": 0.87,
+    "be better": 0.86,
+    "better off": 0.86,
+    "dying": 0.86,
+    "hopeless": 0.86,
+    "way out": 0.84,
+    "miss me": 0.82,
+    "i won't": 0.81,
+    "alive": 0.8,
+    "care if": 0.79,
+    "last night": 0.79,
+    "anymore": 0.78,
+    "on purpose": 0.77,
+    "bridge": 0.76,
+    "won't": 0.76,
+    "wish i": 0.72,
+    "to die": 0.71,
+    "never": 0.7,
+    "ending": 0.69,
+    "life": 0.69,
+    "nobody would": 0.69,
+    "be dead": 0.67,
+    "notice": 0.67,
+    "no": 0.65,
+    "purpose": 0.63,
+    "to end": 0.63,
+    "to stop": 0.63,
+    "tonight": 0.61,
+    "there's no": 0.56,
+    "don't want": 0.54,
+    "i'm planning": 0.54,
+    "planning": 0.54,
+    "ready": 0.54,
+    "i should": 0.53,
+    "won't be": 0.53,
+    "giving": 0.51,
+    "dead": 0.5,
+    "trapped": 0.5,
+    "nobody": 0.47,
+    "thinking": 0.47,
+    "thoughts": 0.45,
+    "i wish": 0.44,
+    "sleeping pills": 0.44,
+    "wish": 0.44,
+    "message": 0.43,
+    "pain": 0.43,
+    "having": 0.42,
+    "rope": 0.4,
+    "things": 0.4,
+    "worthless": 0.4,
+    "will": 0.38,
+    "jump": 0.37,
+    "to jump": 0.37,
+    "leave": 0.36,
+    "a burden": 0.35,
+    "burden": 0.35,
+    "into": 0.34,
+    "to feel": 0.34,
+    "wake": 0.34,
+    "wake up": 0.34,
+    "feel like": 0.33,
+    "live": 0.33,
+    "my life": 0.33,
+    "my pills": 0.33,
+    "come": 0.32,
+    "come back": 0.32,
+    "enough": 0.32,
+    "i can't": 0.31,
+    "no point": 0.31,
+    "a plan": 0.3,
+    "birthday": 0.3,
+    "don't": 0.3,
+    "every": 0.3,
+    "i don't": 0.3,
+    "i'm ready": 0.3,
+    "my birthday": 0.3,
+    "tired of": 0.3,
+    "keep thinking": 0.29,
+    "to kill": 0.29,
+    "again": 0.28,
+    "i'm done": 0.28,
+    "sleep forever": 0.28,
+    "to sleep": 0.28,
+    "without": 0.28,
+    "been thinking": 0.26,
+    "getting": 0.25,
+    "made": 0.25,
+    "off": 0.24,
+    "thinking about": 0.24,
+    "good": 0.23,
+    "miss": 0.23,
+    "date": 0.22,
+    "should": 0.21,
+    "end": 0.2,
+    "i'm thinking": 0.2,
+    "away my": 0.19,
+    "i love": 0.18,
+    "feel hopeless": 0.17,
+    "sleep": 0.17,
+    "was dead": 0.17,
+    "can't": 0.16,
+    "disappear": 0.16,
+    "i wrote": 0.15,
+    "wrote": 0.15,
+    "i took": 0.14,
+    "much": 0.14,
+    "took": 0.14,
+    "my sister": 0.13,
+    "sister": 0.13,
+    "the world": 0.11,
+    "to leave": 0.11,
+    "back": 0.1,
+    "one": 0.1,
+    "to take": 0.1,
+    "the bridge": 0.09,
+    "into a": 0.08,
+    "today": 0.08,
+    "before": 0.07,
+    "stop": 0.06,
+    "day": 0.05,
+    "care": -0.06,
+    "done": -0.07,
+    "family": -0.09,
+    "my family": -0.09,
+    "to disappear": -0.09,
+    "could": -0.1,
+    "i could": -0.1,
+    "being": -0.13,
+    "out": -0.13,
+    "a lot": -0.14,
+    "lot": -0.14,
+    "away": -0.15,
+    "killing": -0.15,
+    "lately": -0.15,
+    "plan": -0.15,
+    "take my": -0.17,
+    "try": -0.17,
+    "people": -0.21,
+    "the time": -0.22,
+    "my parents": -0.24,
+    "night": -0.24,
+    "out of": -0.24,
+    "parents": -0.24,
+    "take": -0.25,
+    "another": -0.28,
+    "i feel": -0.28,
+    "kids": -0.28,
+    "my kids": -0.28,
+    "can't take": -0.3,
+    "best": -0.32,
+    "end my": -0.32,
+    "less": -0.32,
+    "myself to": -0.33,
+    "kill": -0.35,
+    "i'm nervous": -0.36,
+    "at work": -0.37,
+    "better": -0.37,
+    "kill for": -0.37,
+    "sleeping": -0.37,
+    "tired": -0.37,
+    "goodbye to": -0.39,
+    "my job": -0.39,
+    "said goodbye": -0.39,
+    "my friend": -0.4,
+    "died": -0.42,
+    "i'm stressed": -0.43,
+    "stressed": -0.43,
+    "i'm scared": -0.44,
+    "love": -0.44,
+    "scared": -0.44,
+    "feel": -0.45,
+    "i hurt": -0.47,
+    "done with": -0.48,
+    "meeting": -0.48,
+    "morning": -0.48,
+    "phone": -0.48,
+    "exam": -0.5,
+    "trip": -0.53,
+    "give": -0.54,
+    "i'm tired": -0.55,
+    "this week": -0.55,
+    "new": -0.56,
+    "boss": -0.59,
+    "my boss": -0.59,
+    "nervous": -0.59,
+    "old": -0.59,
+    "job": -0.6,
+    "weekend": -0.61,
+    "friends": -0.62,
+    "make": -0.62,
+    "friend": -0.63,
+    "i'm dying": -0.64,
+    "anxious": -0.66,
+    "time": -0.66,
+    "said": -0.67,
+    "some": -0.68,
+    "movie": -0.73,
+    "home": -0.74,
+    "hurt": -0.75,
+    "at night": -0.77,
+    "group": -0.77,
+    "homework": -0.79,
+    "party": -0.84,
+    "early": -0.85,
+    "week": -0.85,
+    "more": -0.88,
+    "work": -1.03,
+}
+BIAS = -1.17
+# Scores at or above this are flagged. Keep it well above sigmoid(BIAS), the
+# score of a message with no known features.
+FLAG_THRESHOLD = float(os.environ.get("CRISIS_FLAG_THRESHOLD", 0.4))
+
+_words = re.compile(r"[a-z']+")
+
+
+class Screening:
+    def __init__(self, crisis, score, matched, flagged=None):
+        self.crisis = crisis
+        self.flagged = crisis if flagged is None else crisis or flagged
+        self.score = score
+        self.matched = matched
+
+
+def features(text):
+    words = _words.findall(text.lower().replace("’", "'"))
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def score(text):
+    total = BIAS + sum(FEATURE_WEIGHTS.get(feature, 0.0) for feature in features(text))
+    return 1.0 / (1.0 + math.exp(-total))
+
+
+def screen(text):
+    text = text.replace("’", "'")
+    match = _phrase_automaton.search(text)
+    if match is not None:
+        return Screening(True, 1.0, match.group(0))
+
+    probability = score(text)
+    match = _ambiguous_automaton.search(text)
+    if match is not None:
+        # Left to the model, whatever the score: these words share features
+        # with real crises, so the score can't tell the two readings apart.
+        return Screening(False, probability, match.group(0), flagged=True)
+    return Screening(False, probability, None, flagged=probability >= FLAG_THRESHOLD)
+
+
+# Sent instantly for a crisis, before (or instead of) any model
+# call, so the user sees help straight away.
+CRISIS_REPLY = os.environ.get("CRISIS_REPLY", (
+    "I'm really sorry you're feeling this way. Your feelings are valid, and you don't have "
+    "to go through this alone. If you are in immediate danger, please call your local "
+    "emergency number now.\n\n"
+    "You can talk to someone right away, any time:\n"
+    "- India: Tele-MANAS 14416 or 1-800-891-4416\n"
+    "- US: call or text 988 (Suicide & Crisis Lifeline)\n"
+    "- UK & Ireland: Samaritans 116 123\n"
+    "- Elsewhere: https://findahelpline.com\n\n"
+    "If you feel able to, would you tell me a little more about what's going on? I'm here to listen."
+))
+
+# Prefixed to flagged user messages when they are replayed to the model
+CRISIS_TAG = "[Safety screen: this message was flagged as possible crisis risk]"
+
+
+def tagged(text):
+    return f"{CRISIS_TAG}\n{text}"
+
+
+def tag_flagged(history):
+    # Model-facing copy of a history with flagged user messages tagged
+    return [
+        {"role": msg["role"], "parts": tagged(msg["parts"])} if msg.get("crisis") else msg
+        for msg in history
+    ]
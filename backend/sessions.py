@@ -0,0 +1,142 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+
+from cachetools import TTLCache
+
+
+_session_id = re.compile(r"[0-9a-f]{32}")
+
+
+class InvalidSession(Exception):
+    pass
+
+
+class UnknownSession(Exception):
+    pass
+
+
+def new_session_id():
+    # Session ids are only ever issued here: 122 random bits, so they can't
+    # be guessed or chosen by a client.
+    return uuid.uuid4().hex
+
+
+def is_session_id(value):
+    return isinstance(value, str) and _session_id.fullmatch(value) is not None
+
+
+class Conversation:
+    # One chat thread: the recent history (in the /chat wire format) and a
+    # rolling summary of older turns.
+    def __init__(self, session_id, history=None):
+        self.id = session_id
+        self.history = history or []
+        self.summary = ""
+        self.lock = threading.Lock()
+
+
+class MemorySessionStore:
+    # LRU + TTL in-process store. Evicted conversations are simply gone.
+    def __init__(self, maxsize=1024, ttl=3600):
+        self._conversations = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            return self._conversations.get(session_id)
+
+    def save(self, conversation):
+        with self._lock:
+            self._conversations[conversation.id] = conversation
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    # Durable history in SQLite, fronted by a MemorySessionStore so hot
+    # conversations are served without a database read.
+    #
+    # There is only ever one Conversation object per session, so its lock
+    # really does allow one turn at a time: loads happen under self._lock,
+    # and _open finds a conversation that is still in use (a turn in flight)
+    # after _live has evicted it, instead of loading a second copy whose
+    # save would overwrite the first.
+    def __init__(self, path, maxsize=1024, ttl=3600):
+        self.ttl = ttl
+        self._live = MemorySessionStore(maxsize=maxsize, ttl=ttl)
+        self._open = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, history TEXT NOT NULL, summary TEXT NOT NULL DEFAULT '', "
+            "updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, session_id):
+        conversation = self._live.get(session_id)
+        if conversation is not None:
+            return conversation
+
+        with self._lock:
+            # Another request may have loaded it since the check above
+            conversation = self._live.get(session_id) or self._open.get(session_id)
+            if conversation is None:
+                row = self._db.execute(
+                    "SELECT history, summary FROM sessions WHERE id = ? AND updated_at > ?",
+                    (session_id, time.time() - self.ttl),
+                ).fetchone()
+                if row is None:
+                    return None
+                conversation = Conversation(session_id, json.loads(row[0]))
+                conversation.summary = row[1]
+                self._open[session_id] = conversation
+            self._live.save(conversation)
+        return conversation
+
+    def save(self, conversation):
+        self._live.save(conversation)
+        with self._lock:
+            self._open[conversation.id] = conversation
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, history, summary, updated_at) VALUES (?, ?, ?, ?)",
+                (conversation.id, json.dumps(conversation.history), conversation.summary, time.time()),
+            )
+            self._db.execute(
+                "DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.ttl,)
+            )
+            self._db.commit()
+
+    def delete(self, session_id):
+        self._live.delete(session_id)
+        with self._lock:
+            self._open.pop(session_id, None)
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+
+
+def create_session_store():
+    # Both stores are per process: session mode needs a single worker, and on
+    # serverless hosts (Vercel) every new instance starts empty; its disk is
+    # per instance too, so SQLite doesn't help there. Clients are expected to
+    # keep their own copy of the history and resend it with "resume" when a
+    # session turns out to be unknown (HTTP 409).
+    backend = os.environ.get("SESSION_STORE", "memory")
+    maxsize = int(os.environ.get("SESSION_MAX_SIZE", 1024))
+    ttl = int(os.environ.get("SESSION_TTL_SECONDS", 3600))
+
+    if backend == "sqlite":
+        path = os.environ.get("SESSION_DB_PATH", "sessions.db")
+        return SQLiteSessionStore(path, maxsize=maxsize, ttl=ttl)
+    if backend == "memory":
+        return MemorySessionStore(maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
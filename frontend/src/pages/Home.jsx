@@ -37,14 +37,26 @@ export default function Home() {
         setInput("");
         setLoading(true);
 
+        // Kept for when the backend doesn't know this session
+        const history = messages.map((msg) => ({
+            role: msg.role,
+            parts: msg.content,  // Match Flask history format
+        }));
+        const resume = { message: input, history, resume: true };
+
         try {
-            const response = await api.post("/chat", {
-                message: input,
-                history: updatedMessages.map((msg) => ({
-                    role: msg.role,
-                    parts: msg.content,  // Match Flask history format
-                })),
-            });
+            // The backend keeps the conversation; only the new message is sent
+            const sessionId = localStorage.getItem("chatSessionId");
+            let response;
+            try {
+                response = await api.post("/chat", sessionId ? { message: input, session_id: sessionId } : resume);
+            } catch (error) {
+                // Session expired or served by another instance: start a new
+                // one from the history kept here
+                if (error.response?.status !== 409) throw error;
+                response = await api.post("/chat", resume);
+            }
+            localStorage.setItem("chatSessionId", response.data.session_id);
 
             // Append assistant's response
             const assistantMessage = { role: "assistant", content: response.data.content };
@@ -66,9 +78,12 @@ export default function Home() {
     // Clear chat history
     const clearChat = async () => {
         try {
-            await api.post("/clear-chat");  // Inform backend if necessary
+            await api.post("/clear-chat", {
+                session_id: localStorage.getItem("chatSessionId") || undefined,
+            });
             setMessages([{ role: "assistant", content: "How can I help you today?" }]);
             localStorage.removeItem("chatHistory");
+            localStorage.removeItem("chatSessionId");
         } catch (error) {
             console.error("Failed to clear chat:", error);
         }